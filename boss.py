@@ -15,6 +15,8 @@ import retrying
 # Our modules
 from worker import Worker
 import message_queue
+from cpu_placement import CpuLayout, PLACEMENT_POLICIES, apply_placement, timing_jitter
+from concurrency import AimdController, HostCpu
 
 __author__ = 'John Stile'
 
@@ -26,10 +28,23 @@ class Boss(object):
        Once all the workers are ready, boss has them all start the test command
        If any quit message has an error exit_status, boss stops all workers
        Once all workers have quit, boss terminates workers.
+       With a controller, workers probe until retired, and boss adds and
+       retires workers during the test, until the controller converges or
+       the duration runs out. Then boss retires all workers.
     """
 
 
-    def __init__(self, ipv4):
+    def __init__(
+            self,
+            ipv4,
+            placement='none',
+            reserve_boss_core=False,
+            worker_nice=None,
+            worker_count=16,
+            controller=None,
+            scale_interval=5.0,
+            duration=300.0,
+    ):
         self.ipv4 = ipv4
 
         # set up multiprocessing logger
@@ -43,41 +58,63 @@ class Boss(object):
         self.log.setLevel('INFO')
         self.log.info('Start Log')
 
-        self.worker_ids = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16]
-        
+        # Adaptive concurrency, None for a fixed number of workers
+        self.controller = controller
+        self.scale_interval = scale_interval
+        self.duration = duration
+        if self.controller:
+            worker_count = self.controller.min_workers
+        self.worker_ids = list(range(1, worker_count + 1))
+        self.next_worker_id = worker_count + 1
+
         # List of of Workers
         self.workers = []
 
         # Store results for all workers 
         self.worker_results = {} 
 
-        # How many times to run
-        self.number_of_runs_cycles = 10
+        # Store command timings for all workers
+        self.worker_timings = {}
+
+        # CPU slot each worker was given, and the cpus of that slot
+        self.worker_slots = {}
+        self.worker_cpus = {}
+
+        # Which cpus the boss and each worker run on
+        self.layout = CpuLayout(self.log, placement, reserve_boss_core)
+        self.worker_nice = worker_nice
+        self.log.info("CPU placement: {}".format(self.layout.describe()))
+
+        # How many times to run, adaptive workers run until retired
+        self.number_of_runs_cycles = None if self.controller else 10
 
         # count total number of quit messages
         self.quit_counter = 0
         self.ready_counter = 0
+        self.test_started = False
+
+        # Workers told to Retire
+        self.retiring = set()
+
+        # Probes reported since the last scaling decision
+        self.probes = 0
+        self.losses = 0
+        self.latencies = []
+        self.scaling = self.controller is not None
+        self.last_scale_time = None
+        self.test_start_time = None
+        self.host_cpu = HostCpu() if self.controller else None
 
         # processing queue for all DUTs
         self.queue = multiprocessing.Queue()
 
     def main(self):
+        # Pin the boss dispatcher before the workers inherit our affinity
+        apply_placement(self.log, self.layout.boss_cpus)
+
         # Create workers, and start
         for worker_id in self.worker_ids:
-            # Each worker runs one command
-            w = Worker(
-                self.ipv4,
-                worker_id,
-                queue_to_boss=self.queue,
-                queue_from_boss=multiprocessing.Queue(),
-                cycles=self.number_of_runs_cycles
-            )
-
-            # Add worker to our list of workers
-            self.workers.append(w)
-
-            # start Worker object run()
-            w.start()
+            self.start_worker(worker_id)
 
         # process messages from Works
         self.process_queue()
@@ -91,7 +128,10 @@ class Boss(object):
         #
         # Print the result for each worker
         #
-        self.log.info("Results for {} cycles".format(self.number_of_runs_cycles))
+        if self.controller:
+            self.log.info("Results for adaptive run")
+        else:
+            self.log.info("Results for {} cycles".format(self.number_of_runs_cycles))
         for (worker_id, error_count) in list(self.worker_results.items()):
             if error_count == 0:
                 this_log = self.log.info
@@ -99,6 +139,76 @@ class Boss(object):
                 this_log = self.log.critical
             this_log("\tworker:{:>2}, error_count:{:>3}".format(worker_id, error_count))
 
+        self.report_timing()
+
+        if self.controller and self.controller.best_workers == 0:
+            self.log.warning("Capacity not determined, no healthy interval was measured")
+        elif self.controller:
+            self.log.info(
+                "Capacity: {:.1f} probes/s sustained with {} workers".format(
+                    self.controller.best_rate,
+                    self.controller.best_workers
+                )
+            )
+
+    def start_worker(self, worker_id):
+        """Create a Worker, add it to our list of workers, and start it"""
+        # Take the least used cpu slot, slots of retiring workers are free
+        slot = self.layout.pick_slot([
+            self.worker_slots[w.worker_id]
+            for w in self.workers
+            if w.worker_id not in self.retiring
+        ])
+        self.worker_slots[worker_id] = slot
+        self.worker_cpus[worker_id] = self.layout.cpus_for(slot)
+
+        # Each worker runs one command
+        w = Worker(
+            self.ipv4,
+            worker_id,
+            queue_to_boss=self.queue,
+            queue_from_boss=multiprocessing.Queue(),
+            cycles=self.number_of_runs_cycles,
+            cpus=self.worker_cpus[worker_id],
+            nice=self.worker_nice
+        )
+
+        # Add worker to our list of workers
+        self.workers.append(w)
+
+        # start Worker object run()
+        w.start()
+
+    def report_timing(self):
+        """Log the command timing jitter of each worker, and for the placement policy"""
+        self.log.info("Timing jitter for placement policy: {}".format(self.layout.policy))
+        summaries = []
+        for (worker_id, timings) in sorted(self.worker_timings.items()):
+            summary = timing_jitter(timings)
+            summaries.append(summary)
+            self.log.info(
+                (
+                    "\tworker:{:>2}, cpus:{}, mean:{:8.3f}ms, stdev:{:8.3f}ms, jitter:{:8.3f}ms"
+                ).format(
+                    worker_id,
+                    sorted(self.worker_cpus.get(worker_id) or []) or 'any',
+                    summary['mean'] * 1000,
+                    summary['stdev'] * 1000,
+                    summary['jitter'] * 1000
+                )
+            )
+        if summaries:
+            self.log.info(
+                (
+                    "Placement {}: mean stdev:{:8.3f}ms, mean jitter:{:8.3f}ms, worst jitter:{:8.3f}ms"
+                ).format(
+                    self.layout.policy,
+                    sum(s['stdev'] for s in summaries) / len(summaries) * 1000,
+                    sum(s['jitter'] for s in summaries) / len(summaries) * 1000,
+                    max(s['jitter'] for s in summaries) * 1000
+                )
+            )
+
 
     def process_queue(self):
         # loop until we read a 'quit' for worker, or an error
@@ -106,27 +216,81 @@ class Boss(object):
         continue_test = True
         while continue_test:
             # When the number of ready messages == workers, start test
-            if self.ready_counter == len(self.workers):
+            if not self.test_started and self.ready_counter == len(self.workers):
                 self.log.info("All Workers ready, start test")
 
                 # Send the message to start testing
                 for worker in self.workers:
                     worker.queue_from_boss.put(message_queue.StatusMessage('BOSS', {'BeginTest': True}))
                 self.ready_counter = 0
+                self.test_started = True
+                self.test_start_time = time.time()
+                self.last_scale_time = self.test_start_time
+
+            # Let the controller add or retire workers
+            if (
+                    self.scaling
+                    and self.test_started
+                    and time.time() - self.last_scale_time >= self.scale_interval
+            ):
+                self.scale()
+
+                if self.controller.converged:
+                    self.stop_scaling("controller converged")
+                elif time.time() - self.test_start_time >= self.duration:
+                    self.stop_scaling("duration of {} seconds reached".format(self.duration))
 
             if self.quit_counter == len(self.workers):
                 self.log.info("All Workers quit, end program")
                 continue_test = False
                 continue
 
-            if not self.queue.empty():
-                try:
-                    msg = self.queue.get(timeout=0.001)
-                    msg.handle(self)
-                except queue.Empty as e:
-                    self.log.warning(
-                        "Queue unexpectedly Empty. {}".format(e)
-                    )
+            # Block briefly, so the boss does not spin a cpu while waiting
+            try:
+                msg = self.queue.get(timeout=0.01)
+            except queue.Empty:
+                continue
+            msg.handle(self)
+
+    def scale(self):
+        """Ask the controller how many workers to run, then add or retire workers"""
+        now = time.time()
+        active = [w for w in self.workers if w.worker_id not in self.retiring]
+        target, reason = self.controller.update(
+            len(active),
+            self.probes,
+            self.losses,
+            self.latencies,
+            now - self.last_scale_time,
+            cpu=self.host_cpu.sample()
+        )
+        self.log.info("Scaling {} -> {} workers: {}".format(len(active), target, reason))
+
+        self.probes = 0
+        self.losses = 0
+        self.latencies = []
+        self.last_scale_time = now
+
+        # Add workers, they start testing as soon as they are Ready
+        for _ in range(target - len(active)):
+            self.log.info("Scaling: start worker {}".format(self.next_worker_id))
+            self.start_worker(self.next_worker_id)
+            self.next_worker_id += 1
+
+        # Retire the newest workers first
+        for w in list(reversed(active))[:max(0, len(active) - target)]:
+            self.log.info("Scaling: retire worker {}".format(w.worker_id))
+            self.retiring.add(w.worker_id)
+            w.queue_from_boss.put(message_queue.StatusMessage('BOSS', {'Retire': True}))
+
+    def stop_scaling(self, reason):
+        """End the adaptive run, by retiring every worker"""
+        self.log.info("Stop scaling, {}, retire all workers".format(reason))
+        self.scaling = False
+        for w in self.workers:
+            if w.worker_id not in self.retiring:
+                self.retiring.add(w.worker_id)
+                w.queue_from_boss.put(message_queue.StatusMessage('BOSS', {'Retire': True}))
 
 
     def on_status(self, worker_id, data):
@@ -138,6 +302,15 @@ class Boss(object):
             self.log.info("StatusMessage: Worker ID:{} is Ready".format(worker_id))
             self.ready_counter += 1
 
+            # Workers added during the test start right away,
+            # unless retired before they were Ready, then the Retire was
+            # emptied from their queue at startup, so send it again
+            w = next((w for w in self.workers if w.worker_id == worker_id), None)
+            if w and worker_id in self.retiring:
+                w.queue_from_boss.put(message_queue.StatusMessage('BOSS', {'Retire': True}))
+            elif w and self.test_started:
+                w.queue_from_boss.put(message_queue.StatusMessage('BOSS', {'BeginTest': True}))
+
         if 'Complete' in data and data['Complete']:
             self.log.info("StatusMessage: Worker ID:{} is Complete".format(worker_id))
 
@@ -163,6 +336,23 @@ class Boss(object):
             self.clean_up(w)
 
 
+    def on_probe(self, worker_id, exit_code, elapsed_time):
+        """ProbeMessage: Collect latency and loss for the controller
+        """
+        self.probes += 1
+        if exit_code == 0:
+            self.latencies.append(elapsed_time)
+        else:
+            self.losses += 1
+
+
+    def on_timing(self, worker_id, timings):
+        """TimingMessage: Store how long each command took
+        """
+        self.log.debug("TimingMessage: worker_id:{}, {} timings".format(worker_id, len(timings)))
+        self.worker_timings[worker_id] = timings
+
+
     def on_log(self, worker_id, log_level, msg):
         """MessageQueue: Log some message
         """
@@ -213,7 +403,123 @@ if __name__ == '__main__':
         required=True,
         help='netbooter ipv4 address'
     )
+    parser.add_argument(
+        '--placement', '-p',
+        choices=PLACEMENT_POLICIES,
+        default='none',
+        help='pin boss and workers to cpus: compact, spread across NUMA nodes, or one NUMA node per worker'
+    )
+    parser.add_argument(
+        '--reserve-boss-core',
+        action='store_true',
+        help='run the boss dispatcher alone on its own cpu'
+    )
+    parser.add_argument(
+        '--worker-nice',
+        type=int,
+        default=None,
+        help='niceness increment for each worker'
+    )
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=16,
+        help='number of workers, when not --adaptive'
+    )
+    parser.add_argument(
+        '--adaptive', '-a',
+        action='store_true',
+        help='add and retire workers to find the maximum sustainable probe rate'
+    )
+    parser.add_argument(
+        '--min-workers',
+        type=int,
+        default=1,
+        help='adaptive: start with, and never go below, this many workers'
+    )
+    parser.add_argument(
+        '--max-workers',
+        type=int,
+        default=64,
+        help='adaptive: never go above this many workers'
+    )
+    parser.add_argument(
+        '--scale-interval',
+        type=float,
+        default=5.0,
+        help='adaptive: seconds between scaling decisions'
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=300.0,
+        help='adaptive: stop after this many seconds of testing'
+    )
+    parser.add_argument(
+        '--converge-after',
+        type=int,
+        default=3,
+        help='adaptive: stop after this many decreases, or intervals held at max workers'
+    )
+    parser.add_argument(
+        '--latency-factor',
+        type=float,
+        default=2.0,
+        help='adaptive: back off when latency exceeds the best latency times this'
+    )
+    parser.add_argument(
+        '--max-loss',
+        type=float,
+        default=0.05,
+        help='adaptive: back off when this fraction of probes fail'
+    )
+    parser.add_argument(
+        '--max-cpu',
+        type=float,
+        default=0.9,
+        help='adaptive: back off when this fraction of host cpu is busy'
+    )
     args = parser.parse_args()
 
-    boss = Boss(args.ipv4)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.adaptive:
+        if args.min_workers < 1:
+            parser.error("--min-workers must be at least 1")
+        if args.max_workers < args.min_workers:
+            parser.error("--max-workers must be at least --min-workers")
+        if args.scale_interval <= 0:
+            parser.error("--scale-interval must be greater than 0")
+        if args.duration <= 0:
+            parser.error("--duration must be greater than 0")
+        if args.converge_after < 1:
+            parser.error("--converge-after must be at least 1")
+        if args.latency_factor <= 1:
+            parser.error("--latency-factor must be greater than 1")
+        if not 0 <= args.max_loss <= 1:
+            parser.error("--max-loss must be between 0 and 1")
+        if not 0 <= args.max_cpu <= 1:
+            parser.error("--max-cpu must be between 0 and 1")
+
+    controller = None
+    if args.adaptive:
+        controller = AimdController(
+            min_workers=args.min_workers,
+            max_workers=args.max_workers,
+            latency_factor=args.latency_factor,
+            max_loss=args.max_loss,
+            max_cpu=args.max_cpu,
+            converge_after=args.converge_after
+        )
+
+    boss = Boss(
+        args.ipv4,
+        placement=args.placement,
+        reserve_boss_core=args.reserve_boss_core,
+        worker_nice=args.worker_nice,
+        worker_count=args.workers,
+        controller=controller,
+        scale_interval=args.scale_interval,
+        duration=args.duration
+    )
     boss.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Adaptive concurrency for the Boss
+
+Instead of a fixed number of workers, the boss can let the AimdController
+decide how many workers to run. Every interval the controller looks at the
+probe latency, probe loss and host CPU, and:
+  - adds workers one step at a time while everything looks healthy
+  - cuts the number of workers by a factor when anything degrades
+(additive increase, multiplicative decrease, like TCP congestion control)
+
+The best probe rate seen while healthy is the capacity of the device under test.
+"""
+
+import statistics
+
+__author__ = 'John Stile'
+
+
+class HostCpu(object):
+    """Measure host CPU use between calls to sample()"""
+
+    def __init__(self):
+        self.last = self._read_proc_stat()
+
+    @staticmethod
+    def _read_proc_stat():
+        """Return (busy, total) jiffies for all cpus, or None if not on Linux"""
+        try:
+            with open('/proc/stat') as f:
+                fields = [int(value) for value in f.readline().split()[1:]]
+        except (IOError, ValueError):
+            return None
+        # idle and iowait are the 4th and 5th fields
+        idle = sum(fields[3:5])
+        total = sum(fields)
+        return total - idle, total
+
+    def sample(self):
+        """Fraction (0.0 - 1.0) of host CPU busy since the last sample, or None if unknown"""
+        current = self._read_proc_stat()
+        if current is None or self.last is None:
+            return None
+        (busy, total) = (current[0] - self.last[0], current[1] - self.last[1])
+        self.last = current
+        if total <= 0:
+            return None
+        return float(busy) / total
+
+
+class AimdController(object):
+    """Decide how many workers to run, from what the workers observed
+
+    :param min_workers: never go below this many workers
+    :param max_workers: never go above this many workers
+    :param step: workers to add when healthy
+    :param decrease_factor: multiply workers by this when degraded
+    :param latency_factor: degraded when mean latency exceeds the best mean latency times this
+    :param max_loss: degraded when this fraction of probes fail
+    :param max_cpu: degraded when this fraction of host CPU is busy
+    :param converge_after: converged after this many decreases, or this many
+                           intervals in a row held at max_workers
+    """
+
+    def __init__(
+            self,
+            min_workers=1,
+            max_workers=64,
+            step=1,
+            decrease_factor=0.5,
+            latency_factor=2.0,
+            max_loss=0.05,
+            max_cpu=0.9,
+            converge_after=3,
+    ):
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError("Need 1 <= min_workers ({}) <= max_workers ({})".format(
+                min_workers,
+                max_workers
+            ))
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1: {}".format(decrease_factor))
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.step = step
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.max_loss = max_loss
+        self.max_cpu = max_cpu
+        self.converge_after = converge_after
+
+        # Count decreases, and intervals in a row held at max_workers
+        self.decreases = 0
+        self.holds = 0
+
+        # Lowest mean latency seen, the latency of an unloaded target
+        self.baseline_latency = None
+
+        # Best healthy probe rate, and how many workers achieved it
+        self.best_rate = 0.0
+        self.best_workers = 0
+
+    def update(self, workers, probes, losses, latencies, elapsed, cpu=None):
+        """Decide the number of workers for the next interval
+        :param workers: int, number of workers running now
+        :param probes: int, probes sent during the interval
+        :param losses: int, probes that failed during the interval
+        :param latencies: list of float, seconds each successful probe took
+        :param elapsed: float, length of the interval in seconds
+        :param cpu: float, fraction of host CPU busy, or None if unknown
+        :return: (target number of workers, reason for the decision)
+        """
+        if probes == 0 or elapsed <= 0:
+            return workers, "hold, no probes yet"
+
+        rate = probes / elapsed
+        loss = float(losses) / probes
+        mean_latency = statistics.mean(latencies) if latencies else None
+
+        if mean_latency is not None and loss <= self.max_loss:
+            if self.baseline_latency is None or mean_latency < self.baseline_latency:
+                self.baseline_latency = mean_latency
+
+        stats = "rate:{:.1f}/s, loss:{:.1%}, latency:{}, cpu:{}".format(
+            rate,
+            loss,
+            "{:.1f}ms".format(mean_latency * 1000) if mean_latency is not None else 'n/a',
+            "{:.0%}".format(cpu) if cpu is not None else 'n/a'
+        )
+
+        degraded = []
+        if loss > self.max_loss:
+            degraded.append("loss above {:.1%}".format(self.max_loss))
+        if (
+                mean_latency is not None
+                and self.baseline_latency is not None
+                and mean_latency > self.baseline_latency * self.latency_factor
+        ):
+            degraded.append("latency above {:.1f}ms".format(
+                self.baseline_latency * self.latency_factor * 1000
+            ))
+        if cpu is not None and cpu > self.max_cpu:
+            degraded.append("cpu above {:.0%}".format(self.max_cpu))
+
+        if degraded:
+            self.decreases += 1
+            self.holds = 0
+            target = max(self.min_workers, int(workers * self.decrease_factor))
+            return target, "decrease, {} ({})".format(", ".join(degraded), stats)
+
+        if rate > self.best_rate:
+            self.best_rate = rate
+            self.best_workers = workers
+
+        target = min(self.max_workers, workers + self.step)
+        if target == workers:
+            self.holds += 1
+            return target, "hold, at max_workers ({})".format(stats)
+        self.holds = 0
+        return target, "increase, healthy ({})".format(stats)
+
+    @property
+    def converged(self):
+        """True once the controller has found the sustainable number of workers"""
+        return self.decreases >= self.converge_after or self.holds >= self.converge_after
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+CPU placement for the Boss and Workers
+
+Pins processes to cores with os.sched_setaffinity, so the scheduler does not
+move them around and add jitter to the timing measurements.
+
+Placement policies:
+  none    - do not pin anything (default, the old behaviour)
+  compact - one core per worker, filling cores in order
+  spread  - one core per worker, round-robin across NUMA nodes
+  node    - each worker may use every core of one NUMA node, round-robin
+
+Affinity and niceness are only available on some platforms (Linux),
+everywhere else the requested placement is logged and ignored.
+"""
+
+import os
+import glob
+import statistics
+
+__author__ = 'John Stile'
+
+
+PLACEMENT_POLICIES = ('none', 'compact', 'spread', 'node')
+
+
+def parse_cpu_list(cpu_list):
+    """Convert a kernel cpu list string, like '0-3,8,10-11', into a list of ints"""
+    cpus = []
+    for part in cpu_list.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def available_cpus():
+    """Cores this process is allowed to run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes(this_log, cpus):
+    """Group cpus by NUMA node
+    :param this_log: logger to report on
+    :param cpus: list of int, the cpus to group
+    :return: list of lists of int, one per node with at least one of cpus.
+    Falls back to a single node when the topology is not available.
+    """
+    nodes = []
+    for path in sorted(
+            glob.glob('/sys/devices/system/node/node[0-9]*/cpulist'),
+            key=lambda p: int(os.path.basename(os.path.dirname(p))[4:])
+    ):
+        try:
+            with open(path) as f:
+                node_cpus = parse_cpu_list(f.read())
+        except (IOError, ValueError) as e:
+            this_log.debug("Could not read {}: {}".format(path, e))
+            continue
+        node_cpus = [cpu for cpu in node_cpus if cpu in cpus]
+        if node_cpus:
+            nodes.append(node_cpus)
+
+    # cpus not listed under any node still need a home
+    seen = set(cpu for node in nodes for cpu in node)
+    missing = [cpu for cpu in cpus if cpu not in seen]
+    if not nodes:
+        return [list(cpus)]
+    if missing:
+        nodes[0].extend(missing)
+    return nodes
+
+
+class CpuLayout(object):
+    """Decide which cpus the Boss and each Worker run on
+
+    The layout is computed once in the Boss, and each Worker is handed its
+    set of cpus, which it applies to itself in run().
+    """
+
+    def __init__(self, this_log, policy='none', reserve_boss_core=False, cpus=None, nodes=None):
+        if policy not in PLACEMENT_POLICIES:
+            raise ValueError("Unknown placement policy: {}".format(policy))
+        self.policy = policy
+        self.reserve_boss_core = reserve_boss_core
+
+        cpus = sorted(cpus) if cpus is not None else available_cpus()
+        nodes = nodes if nodes is not None else numa_nodes(this_log, cpus)
+        nodes = [list(node) for node in nodes]
+
+        # The boss dispatcher gets the first core of the first node to itself,
+        # unless that would leave no core for the workers.
+        self.boss_cpus = None
+        if reserve_boss_core and len(cpus) > 1:
+            boss_cpu = nodes[0][0]
+            self.boss_cpus = {boss_cpu}
+            nodes = [[cpu for cpu in node if cpu != boss_cpu] for node in nodes]
+            nodes = [node for node in nodes if node]
+        elif reserve_boss_core:
+            this_log.warning("Only one cpu available, not reserving a core for the boss")
+
+        self.nodes = nodes
+        self.slots = self._make_slots()
+
+    def _make_slots(self):
+        """List of cpu sets, each worker is given one slot by pick_slot()"""
+        if self.policy == 'compact':
+            return [{cpu} for cpu in sorted(cpu for node in self.nodes for cpu in node)]
+
+        if self.policy == 'spread':
+            slots = []
+            longest = max(len(node) for node in self.nodes)
+            for index in range(longest):
+                for node in self.nodes:
+                    if index < len(node):
+                        slots.append({node[index]})
+            return slots
+
+        if self.policy == 'node':
+            return [set(node) for node in self.nodes]
+
+        # 'none': workers are not pinned, but keep them off the boss core
+        if self.boss_cpus:
+            return [set(cpu for node in self.nodes for cpu in node)]
+        return []
+
+    def pick_slot(self, used):
+        """Slot for a new worker: the least used slot, lowest first
+        :param used: list of slot indexes held by running workers
+        :return: slot index, or None to leave the worker unpinned
+        """
+        if not self.slots:
+            return None
+        return min(range(len(self.slots)), key=lambda slot: (used.count(slot), slot))
+
+    def cpus_for(self, slot):
+        """The set of cpus for a slot from pick_slot(), or None to leave it unpinned"""
+        if slot is None:
+            return None
+        return self.slots[slot]
+
+    def describe(self):
+        """Short text for the log"""
+        return "policy:{}, boss_cpus:{}, nodes:{}".format(
+            self.policy,
+            sorted(self.boss_cpus) if self.boss_cpus else 'any',
+            self.nodes
+        )
+
+
+def apply_placement(this_log, cpus=None, nice=None):
+    """Pin the calling process to cpus and change its niceness
+    :param this_log: logger to report on
+    :param cpus: set of int, or None to leave affinity alone
+    :param nice: int increment for os.nice(), or None to leave it alone
+    """
+    if cpus:
+        if hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(0, cpus)
+                this_log.info("Pinned to cpus: {}".format(sorted(cpus)))
+            except OSError as e:
+                this_log.warning("Could not pin to cpus {}: {}".format(sorted(cpus), e))
+        else:
+            this_log.warning("CPU affinity is not supported on this platform")
+
+    if nice:
+        if hasattr(os, 'nice'):
+            try:
+                this_log.info("Niceness now: {}".format(os.nice(nice)))
+            except OSError as e:
+                this_log.warning("Could not change niceness by {}: {}".format(nice, e))
+        else:
+            this_log.warning("Niceness is not supported on this platform")
+
+
+def timing_jitter(samples):
+    """Summarize the jitter of a list of timings, in seconds
+    :return: dict with count, mean, stdev and the mean difference between
+    consecutive samples (RFC 3550 style jitter)
+    """
+    summary = {'count': len(samples), 'mean': 0.0, 'stdev': 0.0, 'jitter': 0.0}
+    if not samples:
+        return summary
+    summary['mean'] = statistics.mean(samples)
+    if len(samples) > 1:
+        summary['stdev'] = statistics.stdev(samples)
+        summary['jitter'] = statistics.mean(
+            abs(b - a) for (a, b) in zip(samples, samples[1:])
+        )
+    return summary
@@ -51,3 +51,23 @@ class StatusMessage(QueueMessage):
         # Promissed method implemented in receiver
         receiver.on_status(self.sender_id, self.data)
 
+
+class TimingMessage(QueueMessage):
+    """Worker tells Boss how long each of its commands took"""
+    def __init__(self, sender_id, timings):
+        self.sender_id = sender_id
+        self.timings = timings
+
+    def handle(self, receiver):
+        receiver.on_timing(self.sender_id, self.timings)
+
+
+class ProbeMessage(QueueMessage):
+    """Worker tells Boss the result of one command"""
+    def __init__(self, sender_id, exit_code, elapsed_time):
+        self.sender_id = sender_id
+        self.exit_code = exit_code
+        self.elapsed_time = elapsed_time
+
+    def handle(self, receiver):
+        receiver.on_probe(self.sender_id, self.exit_code, self.elapsed_time)
@@ -6,13 +6,16 @@ Worker for simultaneous opteration, communicates with the boss
 """
 
 import multiprocessing
+import itertools
 import logging
 import queue
+import time
 import retrying
 
 # Our modules
 import message_queue
 from test_ping import ping
+from cpu_placement import apply_placement
 
 __author__ = 'John Stile'
 
@@ -29,14 +32,22 @@ class Worker(multiprocessing.Process):
             cycles,
             queue_from_boss,
             queue_to_boss,
+            cpus=None,
+            nice=None,
     ):
         super(Worker, self).__init__()
         self.ipv4 = ipv4
         self.queue_from_boss = queue_from_boss
         self.queue_to_boss = queue_to_boss
+        # None runs until the Boss sends Retire
         self.cycles = cycles
         self.worker_id = worker_id
         self.begin_test = False
+        # Boss sends Retire when it wants fewer workers
+        self.retire = False
+        # CPU placement, applied to the child process in run()
+        self.cpus = cpus
+        self.nice = nice
         #
         # non-pickle-able objects to be initialized in run()
         # to avoid limitation of multiprocessing on windows
@@ -44,6 +55,8 @@ class Worker(multiprocessing.Process):
         self.log = None
         # Result counter
         self.error_count = 0
+        # Seconds each command took
+        self.timings = []
 
     def run(self):
         """"Initialize Logger and notify Boss that Worker is ready"""
@@ -55,10 +68,15 @@ class Worker(multiprocessing.Process):
         fmt = logging.Formatter("%(asctime)s (%(levelname)-8s): %(message)s")
         rh.setFormatter(fmt)
         self.log = logging.getLogger()
-        self.log.setLevel('DEBUG')
+        # Adaptive workers run until retired, keep their per-iteration lines out of the log
+        self.log.setLevel('DEBUG' if self.cycles is not None else 'INFO')
         self.log.addHandler(rh)
         self.log.info("Log Initialized")
         #
+        # Pin to our cpus, before any timing is done
+        #
+        apply_placement(self.log, self.cpus, self.nice)
+        #
         # Empty Multiprocessing queue
         #
         while not self.queue_from_boss.empty():
@@ -107,13 +125,21 @@ class Worker(multiprocessing.Process):
                 continue_test = False
                 continue
 
+            # Boss may retire us before the test starts
+            if self.retire:
+                self.log.info("Retired by Boss before test")
+                continue_test = False
+                continue
+
         self.log.info("Exit while loop.")
 
     def on_status(self, worker_id, data):
         """Boss will send a BeginTest message once all Workers are ready"""
         self.log.debug('Status({})'.format(worker_id, data))
-        if data['BeginTest']:
+        if data.get('BeginTest'):
             self.begin_test = True
+        if data.get('Retire'):
+            self.retire = True
 
     def test(self):
         """Do command
@@ -122,8 +148,27 @@ class Worker(multiprocessing.Process):
 
         try:
             # This is how many times we run the command
-            for iteration in range(1, self.cycles + 1):
-                self.log.info(
+            # Without a cycle limit, per-iteration lines go to DEBUG,
+            # so logging does not load the host we are measuring
+            if self.cycles is None:
+                iterations = itertools.count(1)
+                iteration_log = self.log.debug
+            else:
+                iterations = range(1, self.cycles + 1)
+                iteration_log = self.log.info
+            for iteration in iterations:
+                # Boss may retire us between commands
+                while not self.queue_from_boss.empty():
+                    try:
+                        msg = self.queue_from_boss.get(timeout=0.001)
+                        msg.handle(self)
+                    except queue.Empty:
+                        break
+                if self.retire:
+                    self.log.info("Retired by Boss at Iteration:{:>3}".format(iteration))
+                    break
+
+                iteration_log(
                     (
                         "=====Worker: {:>2}, Iteration:{:>3}, Error Count:{:>3}===="
                     ).format(
@@ -132,18 +177,24 @@ class Worker(multiprocessing.Process):
                         self.error_count
                     )
                 )
-                self.log.info('Run Command')
-                self.queue_to_boss.put(
-                    message_queue.LogMessage(
-                        self.worker_id,
-                        "INFO",
-                        "run{: }".format(iteration)
+                iteration_log('Run Command')
+                if self.cycles is not None:
+                    self.queue_to_boss.put(
+                        message_queue.LogMessage(
+                            self.worker_id,
+                            "INFO",
+                            "run{: }".format(iteration)
+                        )
                     )
-                )
                 try:
-                    self.log.info("ipv4:{}".format(self.ipv4))
+                    iteration_log("ipv4:{}".format(self.ipv4))
+                    start_time = time.perf_counter()
                     stdout_value, elapsed_time = ping(self.ipv4, 4, timeout=0.2)
-                    self.log.info("stdout_value: {}".format(stdout_value))
+                    self.timings.append(time.perf_counter() - start_time)
+                    self.queue_to_boss.put(
+                        message_queue.ProbeMessage(self.worker_id, stdout_value, self.timings[-1])
+                    )
+                    iteration_log("stdout_value: {}".format(stdout_value))
 
                     if stdout_value != 0:
                         self.log.critical("Failed")
@@ -159,6 +210,7 @@ class Worker(multiprocessing.Process):
                     self.error_count += 1
 
             # End For loop
+            self.queue_to_boss.put(message_queue.TimingMessage(self.worker_id, self.timings))
             self.queue_to_boss.put(message_queue.QuitMessage(self.worker_id, self.error_count))
 
         except Exception as e: